@@ -1,12 +1,44 @@
-import json
+import orjson
 import requests
 import logging
-from utils import TaskResultStatus, Severities
+import threading
+from urllib.parse import urlparse
+from utils import TaskResultStatus, Severities, CircuitBreaker, SESSION
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Index into the per-report severity counters; unknown severities land in slot 4.
+SEV_INDEX = {
+    Severities.LOW.value: 0,
+    Severities.MEDIUM.value: 1,
+    Severities.HIGH.value: 2,
+    Severities.CRITICAL.value: 3,
+}
+
+# Outcome text templates, filled in per violation.
+DESC_TMPL = "Policy %s violated by asset %s"
+BODY_TMPL = (
+    "### Severity \n%s \n### Asset ID \n%s \n### Policy \n%s \n### Constraint type \n%s"
+)
+
+# One breaker per Terraform Cloud/TFE host, so one tenant's outage does not
+# block callbacks to another.
+_callback_breakers = {}
+_callback_breakers_lock = threading.Lock()
+
+
+def _callback_breaker(callback_url):
+    """Returns the circuit breaker for the callback URL's host."""
+    host = urlparse(callback_url).netloc
+    with _callback_breakers_lock:
+        breaker = _callback_breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(f"terraform-callback:{host}")
+            _callback_breakers[host] = breaker
+        return breaker
+
 
 def create_task_result_callback_request(
     security_posture_report=None, status=TaskResultStatus.RUNNING
@@ -36,51 +68,61 @@ def create_task_result_callback_request(
             }
         else:
             report_id = security_posture_report["name"]
-            violations = security_posture_report.get("iacValidationReport").get(
-                "violations"
+            report_url = f"https://securityposture.googleapis.com/v1/{report_id}"
+            violations = (
+                security_posture_report.get("iacValidationReport", {}).get("violations")
+                or []
             )
 
-            if violations is None:
-                status = TaskResultStatus.PASSED
-                violations = []
-            else:
-                status = TaskResultStatus.FAILED
+            if not violations:
+                # Nothing to count or list, so skip the outcome loop entirely.
+                return orjson.dumps(
+                    {
+                        "data": {
+                            "type": "task-results",
+                            "attributes": {
+                                "status": TaskResultStatus.PASSED.name.lower(),
+                                "message": "0 asset violations found",
+                                "url": report_url,
+                            },
+                        }
+                    }
+                )
 
-            critical_count = high_count = medium_count = low_count = 0
+            status = TaskResultStatus.FAILED
+            counts = [0] * 5
             outcomes = []
+            outcomes_append = outcomes.append
+            sev_index_get = SEV_INDEX.get
 
             for violation in violations:
                 asset_id = violation.get("assetId")  # Check for None
                 policy_id = violation.get("policyId")  # Check for None
-                constraint_type = violation.get("violatedPolicy").get("constraintType")
+                violated = violation["violatedPolicy"]
+                constraint_type = violated.get("constraintType")
                 severity = violation.get("severity")
 
-                if severity == Severities.LOW.value:
-                    low_count += 1
-                elif severity == Severities.MEDIUM.value:
-                    medium_count += 1
-                elif severity == Severities.HIGH.value:
-                    high_count += 1
-                elif severity == Severities.CRITICAL.value:
-                    critical_count += 1
+                counts[sev_index_get(severity, 4)] += 1
 
                 # Check for None before creating outcome
                 if asset_id and policy_id and constraint_type and severity:
-                    outcomes.append(
+                    outcomes_append(
                         {
                             "type": "task-result-outcomes",
                             "attributes": {
                                 "outcome-id": "sample-outcome-id",
-                                "description": f"Policy {policy_id} violated by asset {asset_id}",
-                                "body": f"### Severity \n{severity} \n### Asset ID \n{asset_id} \n### Policy \n{policy_id} \n### Constraint type \n{constraint_type}",
+                                "description": DESC_TMPL % (policy_id, asset_id),
+                                "body": BODY_TMPL
+                                % (severity, asset_id, policy_id, constraint_type),
                             },
                         }
                     )
 
+            low_count, medium_count, high_count, critical_count = counts[:4]
             task_result_attributes = {
                 "status": status.name.lower(),
                 "message": f"{low_count} LOW, {medium_count} MEDIUM, {high_count} HIGH, {critical_count} CRITICAL asset violations found",
-                "url": f"https://securityposture.googleapis.com/v1/{report_id}",
+                "url": report_url,
             }
             callback_req = {
                 "data": {
@@ -90,7 +132,7 @@ def create_task_result_callback_request(
                 }
             }
 
-        return bytes(json.dumps(callback_req), encoding="utf-8")
+        return orjson.dumps(callback_req)
     except Exception as e:
         logger.error(f"Could not create callback request: {e}")
         return None
@@ -108,16 +150,26 @@ def send_terraform_callback(callback_url, access_token, callback_request):
     Raises:
       requests.exceptions.RequestException: If there's an error sending the callback.
     """
+    breaker = _callback_breaker(callback_url)
+    if not breaker.allow_request():
+        logger.error("Terraform callback circuit open")
+        return 503
+
     try:
         headers = {
             "Content-Type": "application/vnd.api+json",
             "Authorization": f"Bearer {access_token}",
         }
 
-        response = requests.patch(callback_url, headers=headers, data=callback_request)
+        response = SESSION.patch(callback_url, headers=headers, data=callback_request)
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
         return response.status_code
 
     except requests.exceptions.RequestException as e:
+        breaker.record_failure()
         if hasattr(e.response, "status_code"):
             return e.response.status_code
         else:
@@ -1,9 +1,11 @@
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from flask import Request, Response, Flask
 
 from validations import validate_request, validate_hmac_signature
 from iacv import (
+    get_project_id,
     get_access_token,
     get_organization_id,
     validate_iac,
@@ -18,6 +20,10 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Runs the (usually cached) organization lookup alongside the plan download,
+# which stays on the request thread so it never queues behind other requests.
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
 
 @app.route("/", methods=['POST'])
 def analyze_terraform_plan(request: Request):
@@ -32,12 +38,9 @@ def analyze_terraform_plan(request: Request):
         if payload["stage"] == "test":
             return Response("", status=200)
 
-        gcloud_access_token, project_id = get_access_token()
-        print(f"{gcloud_access_token}")
-        if gcloud_access_token is None:
-            logger.error("Failed to obtain access token")
-            return Response("Failed to obtain access token", status=500)
-
+        # Authenticate the request before any work on its behalf. The project
+        # number is cached, so this needs no upstream calls once warm.
+        project_id = get_project_id()
         if project_id is None:
             logger.error("Failed to fetch project ID")
             return Response("Failed to fetch project ID", status=500)
@@ -47,25 +50,31 @@ def analyze_terraform_plan(request: Request):
             logger.error("Failed to fetch project number")
             return Response("Failed to fetch project number", status=500)
 
-        organization_id = get_organization_id(project_id, gcloud_access_token)
-
-        if organization_id is None:
-            logger.error("Failed to fetch organization ID")
-            return Response("Internal server error", status=500)
-
-        # Authenticate request
         if not validate_hmac_signature(request, project_number):
             logger.error("Invalid HMAC signature")
             return Response("Invalid HMAC signature", status=401)
 
+        gcloud_access_token, _ = get_access_token()
+        if gcloud_access_token is None:
+            logger.error("Failed to obtain access token")
+            return Response("Failed to obtain access token", status=500)
+
+        # The organization lookup and the plan download are independent.
+        org_future = EXECUTOR.submit(get_organization_id, project_id)
         plan_file, status_code = fetch_terraform_plan(
             payload["plan_json_api_url"], payload["access_token"]
         )
 
         if status_code != 200:
+            org_future.cancel()
             logger.error("Failed to fetch plan file")
             return Response("Failed to fetch plan file", status_code)
 
+        organization_id = org_future.result()
+        if organization_id is None:
+            logger.error("Failed to fetch organization ID")
+            return Response("Internal server error", status=500)
+
         iacv_operation_id, status_code, error_message = validate_iac(
             plan_file, organization_id, gcloud_access_token, project_id
         )
@@ -1,67 +1,192 @@
 import google.auth
+import google.auth.transport.requests
 import logging
 import requests
-import json
+import orjson
 import base64
 import time
+import datetime
+import functools
+import random
+import threading
 from callback import create_task_result_callback_request, send_terraform_callback
+from utils import CircuitBreaker, SESSION
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tokens with less than this much lifetime left are refreshed inline.
+TOKEN_REFRESH_MARGIN = datetime.timedelta(seconds=300)
+# Tokens with less than this much lifetime left are refreshed in the background.
+TOKEN_STALE_MARGIN = datetime.timedelta(seconds=600)
+
+_credentials = None
+_project_id = None
+_credentials_lock = threading.Lock()
+_background_refresh = None
+_background_refresh_lock = threading.Lock()
+
+IACV_BREAKER = CircuitBreaker("iac-validation")
+IACV_POLL_BREAKER = CircuitBreaker("iac-validation-poll")
+
+# Statuses that mean the API is struggling rather than rejecting the request.
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Exponential backoff with full jitter for IaC Validation API retries.
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_DEADLINE = 60.0
+
+# Adaptive polling of the IaC Validation operation.
+POLL_INITIAL_DELAY = 0.5
+POLL_BACKOFF_FACTOR = 1.5
+POLL_MAX_DELAY = 15.0
+# Seconds between "running" heartbeats sent to Terraform Cloud.
+HEARTBEAT_INTERVAL = 20.0
+
+# Seconds the server may block an operations:wait call, plus the extra
+# client-side allowance before the request is abandoned.
+LRO_WAIT_TIMEOUT = 20
+LRO_CLIENT_TIMEOUT_SLACK = 10
+# Total seconds to spend polling one operation. A poll in flight can run one
+# client timeout past this, which still fits Cloud Run's default 300s limit.
+POLL_DEADLINE = 240.0
+_LRO_WAIT_BODY = orjson.dumps({"timeout": f"{LRO_WAIT_TIMEOUT}s"})
+# Cleared the first time the API reports operations:wait as unsupported.
+_lro_wait_supported = True
+
+
+def _token_time_left():
+    """Returns how long the cached access token remains valid."""
+    if not _credentials.valid:
+        return datetime.timedelta(0)
+    if _credentials.expiry is None:
+        return datetime.timedelta.max
+    return _credentials.expiry - datetime.datetime.utcnow()
+
+
+def _refresh_credentials(margin):
+    """Refreshes the cached credentials unless another thread already has."""
+    with _credentials_lock:
+        if _token_time_left() > margin:
+            return
+        _credentials.refresh(google.auth.transport.requests.Request(session=SESSION))
+
+
+def _background_refresh_credentials():
+    try:
+        _refresh_credentials(TOKEN_STALE_MARGIN)
+    except Exception as e:
+        logger.warning(f"Background access token refresh failed: {e}")
+
+
+def _start_background_refresh():
+    """Starts a daemon thread to refresh the token before it expires."""
+    global _background_refresh
+    with _background_refresh_lock:
+        if _background_refresh is not None and _background_refresh.is_alive():
+            return
+        _background_refresh = threading.Thread(
+            target=_background_refresh_credentials, daemon=True
+        )
+        _background_refresh.start()
+
+
+def _load_credentials():
+    """Resolves the application default credentials once per process."""
+    global _credentials, _project_id
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials, _project_id = google.auth.default()
+
+
+def get_project_id():
+    """
+    Retrieves the ID of the project the service runs in without fetching
+    an access token.
+
+    Returns:
+      The project ID as a string, or None if it cannot be determined.
+    """
+    try:
+        _load_credentials()
+        return _project_id
+
+    except Exception as e:
+        logger.error(f"Error getting project ID: {e}")
+        return None
+
 
 def get_access_token():
     """
     Retrieves an access token for the Cloud Run service account.
 
+    The credentials are resolved once per process and the token is cached
+    until it nears expiry, so most calls make no network requests.
+
     Returns:
       A string containing the access token.
     """
     try:
-        credentials, project_id = google.auth.default()
-        credentials.refresh(google.auth.transport.requests.Request())
-        return credentials.token, project_id
+        _load_credentials()
+
+        time_left = _token_time_left()
+        if time_left <= TOKEN_REFRESH_MARGIN:
+            _refresh_credentials(TOKEN_REFRESH_MARGIN)
+        elif time_left <= TOKEN_STALE_MARGIN:
+            _start_background_refresh()
+
+        return _credentials.token, _project_id
 
     except Exception as e:
         logger.error(f"Error getting access token: {e}")
         return None, None
 
 
-def get_organization_id(project_id, auth_token):
+@functools.lru_cache(maxsize=32)
+def _get_org_id_cached(project_id):
     """
-    Extracts the organization ID from a given project ID using an auth token
-    and the REST API.
+    Looks up the organization ID of a project. Successful lookups are cached
+    for the life of the process; failures raise and so are retried next time.
+    """
+    auth_token, _ = get_access_token()
+
+    # Construct the API URL
+    url = f"https://cloudresourcemanager.googleapis.com/v1/projects/{project_id}:getAncestry"
+
+    # Set up the request headers
+    headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json",
+    }
+
+    # Send the request
+    response = SESSION.post(url, headers=headers, data=orjson.dumps({}))
+    response.raise_for_status()  # Raise an exception for bad status codes
+
+    data = response.json()
+
+    # Extract organization ID from the ancestry response
+    for ancestor in data.get("ancestor", []):
+        if ancestor["resourceId"]["type"] == "organization":
+            return ancestor["resourceId"]["id"]
+
+    raise LookupError(f"No organization found for project {project_id}")
+
+
+def get_organization_id(project_id):
+    """
+    Extracts the organization ID from a given project ID using the REST API.
 
     Args:
       project_id: The ID of the Google Cloud project.
-      auth_token: The authentication token.
 
     Returns:
       The organization ID as a string, or None if not found.
     """
     try:
-        # Construct the API URL
-        url = f"https://cloudresourcemanager.googleapis.com/v1/projects/{project_id}:getAncestry"
-
-        # Set up the request headers
-        headers = {
-            "Authorization": f"Bearer {auth_token}",
-            "Content-Type": "application/json",
-        }
-
-        # Send the request
-        response = requests.post(url, headers=headers)
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        data = response.json()
-
-        # Extract organization ID from the ancestry response
-        for ancestor in data.get("ancestor", []):
-            if ancestor["resourceId"]["type"] == "organization":
-                return ancestor["resourceId"]["id"]
-
-        return None
+        return _get_org_id_cached(project_id)
 
     except Exception as e:
         logger.error(f"Error getting organization ID: {e}")
@@ -78,18 +203,36 @@ def _create_gcloud_request_headers(gcloud_access_token, project_id):
     }
 
 
-def _create_iac_validation_request_body(plan_json, org_id):
+def _create_iac_validation_request_body(plan_bytes, org_id):
     """Creates the request body for the IaC Validation API."""
     parent = f"organizations/{org_id}/locations/global"
-    tf_plan = base64.b64encode(json.dumps(plan_json).encode("utf-8")).decode("utf-8")
+    tf_plan = base64.b64encode(plan_bytes).decode("ascii")
     return {"parent": parent, "iac": {"tf_plan": tf_plan}}
 
 
+def _retry_delay(attempt, response=None):
+    """
+    Returns the number of seconds to wait before the next retry.
+
+    Honors the server's Retry-After header as given when it is a delay in
+    seconds, otherwise uses exponential backoff with full jitter. Only the
+    backoff is capped at RETRY_MAX_DELAY.
+    """
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass  # HTTP-date form, fall back to backoff
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+
 def _call_iac_validation_api(url, headers, body):
     """
     Calls the Security Command Center IaC Validation API.
-    Retries the API call up to three times with exponential backoff
-    if the response status code is in the retryable list.
+    Retries the API call up to three times with jittered exponential backoff
+    on connection errors, timeouts, or a response status code in the
+    retryable list, giving up once RETRY_DEADLINE seconds have passed.
 
     Args:
       url: The API endpoint URL.
@@ -102,45 +245,80 @@ def _call_iac_validation_api(url, headers, body):
         - The HTTP status code (200 on success, error code otherwise).
         - An error message if applicable, otherwise None.
     """
-    retryable_status_codes = [408, 429, 500, 502, 503, 504]
-    retry_delays = [5, 10, 20]  # Delays in seconds for each retry
+    deadline = time.monotonic() + RETRY_DEADLINE
+
+    # The body is the same on every attempt, so serialize it only once.
+    payload = orjson.dumps(body)
+    headers = {**headers, "Content-Length": str(len(payload))}
+
+    # The breaker is consulted and updated once per call, not per attempt.
+    if not IACV_BREAKER.allow_request():
+        error_message = "IaC Validation API circuit open"
+        logger.error(error_message)
+        return None, 503, error_message
 
     for i in range(4):  # Retry up to 3 times
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(body))
-            return response.json()["name"], 200, None  # Success
-
+            response = SESSION.post(
+                url,
+                headers=headers,
+                data=payload,
+                timeout=max(1, deadline - time.monotonic()),
+            )
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ) as e:
+            response = None
+            reason = str(e)
         except requests.exceptions.RequestException as e:
-            if (
-                hasattr(e.response, "status_code")
-                and e.response.status_code in retryable_status_codes
-            ):
-                if i == 3:
-                    break
-                logger.warning(
-                    f"Retryable error ({e.response.status_code}) calling IaC Validation API. Retrying in {retry_delays[i]} seconds..."
-                )
-                time.sleep(retry_delays[i])  # Wait before retrying
-            else:
-                error_message = f"Error calling IaC Validation API: {e}"
-                logger.error(error_message)
-                if hasattr(e.response, "status_code"):
-                    return None, e.response.status_code, error_message
-                else:
+            IACV_BREAKER.record_failure()
+            error_message = f"Error calling IaC Validation API: {e}"
+            logger.error(error_message)
+            return None, 500, error_message
+        else:
+            if response.ok:
+                try:
+                    report_name = orjson.loads(response.content)["name"]
+                except (orjson.JSONDecodeError, KeyError) as e:
+                    IACV_BREAKER.record_failure()
+                    error_message = f"Malformed IaC Validation API response: {e!r}"
+                    logger.error(error_message)
                     return None, 500, error_message
+                IACV_BREAKER.record_success()
+                return report_name, 200, None  # Success
+
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                # The API is up and rejected the request; don't trip the breaker.
+                IACV_BREAKER.record_success()
+                error_message = f"Error calling IaC Validation API: {response.status_code} {response.text}"
+                logger.error(error_message)
+                return None, response.status_code, error_message
+
+            reason = response.status_code
+
+        delay = _retry_delay(i, response)
+        # Give up rather than retry sooner than the server asked.
+        if i == 3 or delay > RETRY_MAX_DELAY or time.monotonic() + delay > deadline:
+            break
+        logger.warning(
+            f"Retryable error ({reason}) calling IaC Validation API. Retrying in {delay:.1f} seconds..."
+        )
+        time.sleep(delay)  # Wait before retrying
 
     # If all retries fail, return the last error
+    IACV_BREAKER.record_failure()
     error_message = "All retries failed for IaC Validation API call."
     logger.error(error_message)
     return None, 500, error_message
 
 
-def validate_iac(plan_json, org_id, gcloud_access_token, project_id):
+def validate_iac(plan_bytes, org_id, gcloud_access_token, project_id):
     """
     Analyzes the Terraform plan using Security Command Center's IaC Validation API.
 
     Args:
-      plan_json: The Terraform plan as a JSON object.
+      plan_bytes: The raw Terraform plan JSON as bytes.
       org_id: The organization ID.
       gcloud_access_token: The Google Cloud access token.
       project_id: The Google Cloud project ID.
@@ -155,11 +333,111 @@ def validate_iac(plan_json, org_id, gcloud_access_token, project_id):
     parent = f"organizations/{org_id}/locations/global"
     url = f"https://securityposture.googleapis.com/v1/{parent}/reports:createIaCValidationReport"
 
-    body = _create_iac_validation_request_body(plan_json, org_id)
+    body = _create_iac_validation_request_body(plan_bytes, org_id)
 
     return _call_iac_validation_api(url, headers, body)
 
 
+class _Heartbeat:
+    """
+    Sends "running" callbacks to Terraform Cloud on a timer, independently of
+    how often the operation is polled.
+    """
+
+    def __init__(self, callback_url, access_token, callback_request):
+        self.callback_url = callback_url
+        self.access_token = access_token
+        self.callback_request = callback_request
+        self.failed_status_code = None
+        self._timer = None
+        self._stopped = False
+        # Guards _timer and _stopped so stop() never sees an unstarted timer.
+        self._lock = threading.Lock()
+
+    def send(self):
+        """Sends one heartbeat and returns its status code."""
+        status_code = send_terraform_callback(
+            self.callback_url, self.access_token, self.callback_request
+        )
+        if status_code != 200:
+            self.failed_status_code = status_code
+        return status_code
+
+    def start(self, delay=HEARTBEAT_INTERVAL):
+        """Schedules the next heartbeat to be sent after delay seconds."""
+        with self._lock:
+            if self._stopped or self.failed_status_code is not None:
+                return
+            self._timer = threading.Timer(delay, self._tick)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _tick(self):
+        with self._lock:
+            if self._stopped:
+                return
+        self.send()
+        self.start()
+
+    def stop(self):
+        """
+        Cancels further heartbeats and waits for one in flight, so that no
+        "running" callback can land after the final task result.
+        """
+        with self._lock:
+            self._stopped = True
+            timer = self._timer
+        if timer is not None:
+            timer.cancel()
+            if timer is not threading.current_thread() and timer.is_alive():
+                timer.join()
+
+
+def _wait_unsupported(response):
+    """
+    Returns True if an operations:wait response shows the API has no such
+    method, as opposed to an error about this particular operation.
+    """
+    if response.status_code in (405, 501):
+        return True
+    return response.status_code == 404 and (
+        b"Method not found" in response.content or b":wait" in response.content
+    )
+
+
+def _get_operation(url, headers):
+    """
+    Fetches the long-running operation, letting the server block until it
+    completes (up to LRO_WAIT_TIMEOUT seconds) when operations:wait is supported.
+
+    Returns:
+      A tuple containing:
+        - The operation as a dictionary.
+        - True if the server waited on the operation, otherwise False.
+
+    Raises:
+      requests.exceptions.HTTPError: If the API returns an error status.
+    """
+    global _lro_wait_supported
+    timeout = LRO_WAIT_TIMEOUT + LRO_CLIENT_TIMEOUT_SLACK
+    if _lro_wait_supported:
+        response = SESSION.post(
+            f"{url}:wait",
+            headers=headers,
+            data=_LRO_WAIT_BODY,
+            timeout=timeout,
+        )
+        if not _wait_unsupported(response):
+            response.raise_for_status()
+            return orjson.loads(response.content), True
+        logger.info("operations:wait is not supported, falling back to polling")
+        _lro_wait_supported = False
+
+    response = SESSION.get(url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return orjson.loads(response.content), False
+
+
 def fetch_iac_validation_report(
     operation_id,
     gcloud_access_token,
@@ -183,32 +461,88 @@ def fetch_iac_validation_report(
     Raises:
       requests.exceptions.RequestException: If there's an error fetching the report.
     """
+    heartbeat = None
     try:
         headers = _create_gcloud_request_headers(gcloud_access_token, project_id)
         url = f"https://securityposture.googleapis.com/v1/{operation_id}"
 
+        callback_request = create_task_result_callback_request()
+        if callback_request is None:
+            return None, 500, f"Error creating callback request"
+
+        heartbeat = _Heartbeat(
+            task_result_callback_url, terraform_access_token, callback_request
+        )
+        # The first heartbeat goes out alongside the first poll.
+        heartbeat.start(delay=0)
+
+        delay = POLL_INITIAL_DELAY
+        deadline = time.monotonic() + POLL_DEADLINE
         while True:
-            callback_request = create_task_result_callback_request()
-            if callback_request is None:
-                return None, 500, f"Error creating callback request"
-            callback_status_code = send_terraform_callback(
-                task_result_callback_url, terraform_access_token, callback_request
-            )
-            if callback_status_code != 200:
-                return None, callback_status_code, f"Error sending callback request"
-            operation_details = requests.get(url, headers=headers).json()
-            if operation_details["done"]:  # Simplified boolean check
+            if time.monotonic() >= deadline:
+                error_message = "Timed out waiting for IaC Validation report"
+                logger.error(error_message)
+                return None, 504, error_message
+            if heartbeat.failed_status_code is not None:
+                return (
+                    None,
+                    heartbeat.failed_status_code,
+                    f"Error sending callback request",
+                )
+            if not IACV_POLL_BREAKER.allow_request():
+                return None, 503, "IaC Validation API circuit open"
+            poll_started = time.monotonic()
+            try:
+                operation_details, waited = _get_operation(url, headers)
+            except requests.exceptions.HTTPError as e:
+                # A 4xx such as a bad operation name or missing permission
+                # says nothing about the API's health.
+                if e.response.status_code in RETRYABLE_STATUS_CODES:
+                    IACV_POLL_BREAKER.record_failure()
+                else:
+                    IACV_POLL_BREAKER.record_success()
+                raise
+            except (requests.exceptions.RequestException, orjson.JSONDecodeError):
+                IACV_POLL_BREAKER.record_failure()
+                raise
+            IACV_POLL_BREAKER.record_success()
+            if "error" in operation_details:
+                error_message = (
+                    f"IaC Validation operation failed: {operation_details['error']}"
+                )
+                logger.error(error_message)
+                return None, 500, error_message
+            # "done" is omitted from the JSON while the operation is running.
+            if operation_details.get("done"):
                 break
 
-            time.sleep(10)
-
-        report = operation_details["response"]
+            # operations:wait is best-effort and may return early. Poll again
+            # straight away only if the server actually blocked for a while.
+            blocked = time.monotonic() - poll_started
+            if not waited or blocked < LRO_WAIT_TIMEOUT / 2:
+                time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+                delay = min(POLL_MAX_DELAY, delay * POLL_BACKOFF_FACTOR)
+
+        heartbeat.stop()
+        if heartbeat.failed_status_code is not None:
+            return None, heartbeat.failed_status_code, f"Error sending callback request"
+
+        report = operation_details.get("response")
+        if report is None:
+            error_message = "Malformed IaC Validation operation: no response"
+            logger.error(error_message)
+            return None, 500, error_message
         return report, 200, None
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         error_message = f"Error fetching IaC Validation report: {e}"
         logger.error(error_message)
-        if hasattr(e.response, "status_code"):
-            return None, e.response.status_code, error_message
+        response = getattr(e, "response", None)
+        if hasattr(response, "status_code"):
+            return None, response.status_code, error_message
         else:
             return None, 500, error_message
+
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
@@ -1,12 +1,25 @@
+import functools
+import http.cookiejar
 import logging
+import threading
+import time
 from enum import Enum, auto
 from google.cloud import resourcemanager_v3
 import requests
+from requests.adapters import HTTPAdapter
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared HTTP session so outbound calls reuse pooled keep-alive connections.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=0)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+# The session is shared across tenants, so never store or replay cookies.
+SESSION.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+
 
 class TaskResultStatus(Enum):
     """Enum for task result statuses."""
@@ -25,6 +38,69 @@ class Severities(Enum):
     LOW = "LOW"
 
 
+class CircuitState(Enum):
+    """Enum for circuit breaker states."""
+
+    CLOSED = auto()
+    OPEN = auto()
+    HALF_OPEN = auto()
+
+
+class CircuitBreaker:
+    """
+    Fails calls to an upstream service fast while it is known to be down.
+
+    The breaker opens after `fail_max` consecutive failures. Once
+    `reset_timeout` seconds have passed a single trial call is let through
+    (half-open); its success closes the breaker and its failure re-opens it.
+    A trial that never reports back is replaced by a new one after another
+    `reset_timeout` seconds.
+    """
+
+    def __init__(self, name, fail_max=5, reset_timeout=60):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self.failure_count = 0
+        self.last_failure_ts = 0.0
+        self.trial_started_ts = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Returns True if a call may be made to the upstream service."""
+        with self._lock:
+            if self.state == CircuitState.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == CircuitState.OPEN:
+                since = self.last_failure_ts
+            else:
+                since = self.trial_started_ts
+            if now - since >= self.reset_timeout:
+                self.state = CircuitState.HALF_OPEN
+                self.trial_started_ts = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self.failure_count = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failure_count += 1
+            self.last_failure_ts = time.monotonic()
+            if (
+                self.state == CircuitState.HALF_OPEN
+                or self.failure_count >= self.fail_max
+            ):
+                if self.state != CircuitState.OPEN:
+                    logger.warning(f"Circuit breaker {self.name} opened")
+                self.state = CircuitState.OPEN
+
+
 def fetch_terraform_plan(plan_url, api_token):
     """
     Fetches the Terraform plan JSON from the given URL.
@@ -34,7 +110,9 @@ def fetch_terraform_plan(plan_url, api_token):
       api_token: The API token for authentication.
 
     Returns:
-      The Terraform plan as a JSON object.
+      A tuple containing:
+        - The raw Terraform plan JSON as bytes, undecoded.
+        - The HTTP status code.
 
     Raises:
       requests.exceptions.RequestException: If there's an error fetching the plan.
@@ -42,8 +120,8 @@ def fetch_terraform_plan(plan_url, api_token):
 
     try:
         headers = {"Authorization": f"Bearer {api_token}"}
-        response = requests.get(plan_url, headers=headers)
-        return response.json(), response.status_code
+        response = SESSION.get(plan_url, headers=headers)
+        return response.content, response.status_code
 
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching Terraform plan: {e}")
@@ -53,6 +131,24 @@ def fetch_terraform_plan(plan_url, api_token):
             return None, 500
 
 
+@functools.lru_cache(maxsize=1)
+def _projects_client():
+    """Returns a process-wide Resource Manager projects client."""
+    return resourcemanager_v3.ProjectsClient()
+
+
+@functools.lru_cache(maxsize=32)
+def _get_project_number_cached(project_id):
+    """Cached project number lookup; raises if the project is not found."""
+    request = resourcemanager_v3.SearchProjectsRequest(query=f"id:{project_id}")
+    page_result = _projects_client().search_projects(request=request)
+    for response in page_result:
+        if response.project_id == project_id:
+            project = response.name
+            return project.replace("projects/", "")
+    raise LookupError(f"Project {project_id} not found")
+
+
 def get_project_number(project_id):
     """
     Fetches the project number of a GCP project using its project ID.
@@ -64,14 +160,7 @@ def get_project_number(project_id):
       The project number as a string, or None if the project is not found.
     """
     try:
-        client = resourcemanager_v3.ProjectsClient()
-        request = resourcemanager_v3.SearchProjectsRequest(query=f"id:{project_id}")
-        page_result = client.search_projects(request=request)
-        for response in page_result:
-            if response.project_id == project_id:
-                project = response.name
-                return project.replace("projects/", "")
-        return None
+        return _get_project_number_cached(project_id)
     except Exception as e:
         logger.error(f"Error fetching project number: {e}")
         return None
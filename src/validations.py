@@ -1,9 +1,11 @@
 from flask import Request, request, Response
 import logging
 import json
-import hashlib
 import hmac
 import base64
+import functools
+import threading
+import time
 
 from google.cloud import secretmanager
 
@@ -11,6 +13,45 @@ from google.cloud import secretmanager
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+REQUIRED_BODY_FIELDS = frozenset(
+    {
+        "stage",
+        "access_token",
+        "organization_name",
+        "plan_json_api_url",
+        "task_result_callback_url",
+    }
+)
+
+# Seconds a fetched HMAC key is reused before Secret Manager is asked again.
+HMAC_KEY_TTL = 300
+
+_hmac_key_cache = {}
+_hmac_key_cache_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _secret_manager_client():
+    """Returns a process-wide Secret Manager client."""
+    return secretmanager.SecretManagerServiceClient()
+
+
+def _get_hmac_key(secret_name):
+    """Returns the secret's payload bytes, cached for HMAC_KEY_TTL seconds."""
+    now = time.monotonic()
+    with _hmac_key_cache_lock:
+        cached = _hmac_key_cache.get(secret_name)
+    if cached is not None and now - cached[1] < HMAC_KEY_TTL:
+        return cached[0]
+
+    response = _secret_manager_client().access_secret_version(
+        request={"name": secret_name}
+    )
+    secret_key_bytes = response.payload.data
+    with _hmac_key_cache_lock:
+        _hmac_key_cache[secret_name] = (secret_key_bytes, now)
+    return secret_key_bytes
+
 
 def validate_request(request):
     """
@@ -30,21 +71,13 @@ def validate_request(request):
         return False, "Missing header field: X-TFC-Task-Signature"
 
     # Validate body fields
-    try:
-        body = request.get_json()
-    except:
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
         return False, "Invalid JSON body"
 
-    required_body_fields = [
-        "stage",
-        "access_token",
-        "organization_name",
-        "plan_json_api_url",
-        "task_result_callback_url",
-    ]
-    for field in required_body_fields:
-        if field not in body:
-            return False, f"Missing body field: {field}"
+    missing = REQUIRED_BODY_FIELDS - body.keys()
+    if missing:
+        return False, f"Missing body field: {min(missing)}"
 
     return True, None
 
@@ -68,14 +101,10 @@ def validate_hmac_signature(request: Request, project_number):
         secret_name = (
             f"projects/{project_number}/secrets/HCP_TERRAFORM_HMAC/versions/latest"
         )
-        client = secretmanager.SecretManagerServiceClient()
-        response = client.access_secret_version(request={"name": secret_name})
-        secret_key = response.payload.data.decode("UTF-8")
+        secret_key_bytes = _get_hmac_key(secret_name)
         # Calculate the expected signature
         payload = request.get_data()
-        expected_signature = hmac.new(
-            secret_key.encode("UTF-8"), payload, hashlib.sha512
-        ).hexdigest()
+        expected_signature = hmac.digest(secret_key_bytes, payload, "sha512").hex()
 
         # Compare the signatures
         return hmac.compare_digest(signature_header, expected_signature)